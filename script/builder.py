@@ -1,12 +1,28 @@
 # -*- coding: utf-8 -*-
 import json
 import requests
-import copy
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import yaml
 import os
+import sys
 import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone, timedelta
 from email.utils import parsedate_to_datetime
+from functools import lru_cache
+
+# JSON 编解码：优先使用 orjson (原生实现，快数倍)，未安装时回退到标准库
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# YAML 解析器：优先使用 libyaml 的 C 实现 (快约 20 倍)，不可用时回退到纯 Python 实现
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
 
 # ==============================================================================
 # 配置区域 (Configuration)
@@ -17,6 +33,9 @@ UPSTREAM_URL = "https://rules2.clearurls.xyz/data.minify.json"
 # 上游规则的 Hash 校验文件地址
 UPSTREAM_HASH_URL = "https://rules2.clearurls.xyz/rules.minify.hash"
 
+# 网络请求超时 (连接超时, 读取超时)，单位：秒
+REQUEST_TIMEOUT = (5, 30)
+
 # 本地文件路径配置
 OUTPUT_DIR = "rules"  # 输出目录
 UPSTREAM_FILE = os.path.join(OUTPUT_DIR, "upstream_rules.json")  # 上游规则备份 (Pretty)
@@ -31,27 +50,74 @@ BADGE_FILE = os.path.join(OUTPUT_DIR, "badge.json")  # 日期徽章文件
 LOG_FILE = os.path.join(OUTPUT_DIR, "merge_log.txt")  # 构建日志
 CUSTOM_FILE = "custom_rules.yaml"  # 自定义规则配置文件
 
+# 安静模式：设置环境变量 QUIET=1 时不记录逐个 Provider 的处理明细 (警告仍会记录)
+QUIET = os.environ.get("QUIET") == "1"
+# 设置环境变量 WRITE_PRETTY=0 可跳过 merged_rules.json (插件只使用 Minified 文件)
+WRITE_PRETTY = os.environ.get("WRITE_PRETTY", "1") != "0"
+
+# 增量构建缓存 (上次构建的上游/自定义规则 Hash)，放在输出目录之外以免被发布
+CACHE_FILE = ".build_cache.json"
+# 跳过构建前需确认这些产物仍然存在
+BUILD_ARTIFACTS = (
+    UPSTREAM_FILE,
+    MINIFIED_FILE,
+    MINIFIED_HASH_FILE,
+    BADGE_FILE,
+    LOG_FILE,
+) + ((OUTPUT_FILE,) if WRITE_PRETTY else ())
+
+# 大文件 (Pretty JSON) 的写入缓冲区大小：1 MiB，减少 write 系统调用次数
+WRITE_BUFFER_SIZE = 1 << 20
+# 下载分块大小：64 KiB，边接收边计算 Hash
+DOWNLOAD_CHUNK_SIZE = 1 << 16
+
 # 定义时区：北京时间 (UTC+8)
 CN_TZ = timezone(timedelta(hours=8))
+# 本次运行的时间 (脚本运行时间很短，统一计算一次供日志头和徽章复用)
+NOW_CN = datetime.now(CN_TZ)
+NOW_STR = NOW_CN.replace(tzinfo=None).isoformat(sep=" ", timespec="seconds")
 
 # 特殊标记：用于清空某个数组字段
 KEYWORD_DELETE_ALL = "DELETE_ENTIRE_ARRAY"
 
-# 默认的 Provider 结构模板
-DEFAULT_PROVIDER = {
-    "urlPattern": "",
-    "completeProvider": True,
-    "rules": [],
-    "referralMarketing": [],
-    "rawRules": [],
-    "exceptions": [],
-    "redirections": [],
-    "forceRedirection": False,
+# 字段定义
+# 有序元组用于遍历，frozenset 用于 O(1) 成员判断
+RULE_FIELDS = ("rules", "referralMarketing", "rawRules", "redirections")
+MINIFY_ARRAY_KEYS = RULE_FIELDS + ("exceptions",)  # Minified 输出中数组字段的固定顺序
+ARRAY_FIELDS = frozenset(MINIFY_ARRAY_KEYS)
+SCALAR_FIELDS = ("urlPattern", "completeProvider", "forceRedirection")
+
+# 字段操作分派表：补丁字段名 -> (操作模式, 目标字段)
+# append: 追加 | rst: 覆盖 | del: 删除 | scalar: 标量覆盖 | skip: 忽略 (标量不支持 del-)
+FIELD_OP = {
+    **{f: ("append", f) for f in ARRAY_FIELDS},
+    **{f"rst-{f}": ("rst", f) for f in ARRAY_FIELDS},
+    **{f"del-{f}": ("del", f) for f in ARRAY_FIELDS},
+    **{f: ("scalar", f) for f in SCALAR_FIELDS},
+    **{f"rst-{f}": ("scalar", f) for f in SCALAR_FIELDS},
+    **{f"del-{f}": ("skip", f) for f in SCALAR_FIELDS},
 }
 
-# 字段定义
-RULE_FIELDS = ["rules", "referralMarketing", "rawRules", "redirections"]
-ARRAY_FIELDS = RULE_FIELDS + ["exceptions"]
+# 操作类型 -> 预先格式化的日志前缀 (避免为每个 Provider 重复格式化)
+ACTION_PREFIX = {
+    k: f"    [{k:<6}] "
+    for k in ("", "Create", "Modify", "Merge (Add->Mod)", "Create (Mod->Add)")
+}
+
+# HTTP 会话：规则与 Hash 位于同一主机，复用连接池可省去重复的 TCP/TLS 握手
+# (requests 默认已携带 Accept-Encoding: gzip, deflate，响应会压缩传输)
+# 连接失败或 5xx 时短暂退避重试，避免 CI 偶发网络抖动导致整次构建失败
+SESSION = requests.Session()
+SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=2,
+        pool_maxsize=4,
+        max_retries=Retry(
+            total=3, backoff_factor=0.3, status_forcelist=(500, 502, 503, 504)
+        ),
+    ),
+)
 
 # ==============================================================================
 # 工具类与辅助函数 (Utils)
@@ -64,37 +130,61 @@ class MergeLogger:
     1. 同时输出到控制台和内存列表。
     2. 收集警告信息以便在日志末尾汇总。
     3. 支持北京时间的时间戳。
+    4. 逐个 Provider 的明细先缓冲，再一次性写到控制台；安静模式下直接丢弃。
     """
 
-    def __init__(self):
+    FLUSH_EVERY = 64  # 缓冲的明细达到该行数时批量写出一次
+
+    def __init__(self, quiet=False):
         self.lines = []
         self.warnings = []
+        self.quiet = quiet
+        self._pending = []  # 尚未写到控制台的明细
 
     def log(self, message):
         """记录普通信息"""
+        self.flush()
         print(message)
         self.lines.append(message)
 
+    def detail(self, message):
+        """记录逐个 Provider 的明细 (控制台输出延迟到 flush 时批量写出)"""
+        if self.quiet:
+            return
+        self._pending.append(message)
+        self.lines.append(message)
+        if len(self._pending) >= self.FLUSH_EVERY:
+            self.flush()
+
+    def flush(self):
+        """将缓冲的明细一次性写到控制台"""
+        if self._pending:
+            sys.stdout.write("\n".join(self._pending) + "\n")
+            self._pending.clear()
+
     def warn(self, message):
         """记录警告信息 (控制台显示黄色)"""
+        self.flush()
         print(f"\033[93m{message}\033[0m")
         self.warnings.append(message)
         self.lines.append(message)
 
     def header(self, upstream_ts, custom_ts):
-        """生成日志头部信息"""
-        now = datetime.now(CN_TZ).strftime("%Y-%m-%d %H:%M:%S")
-        self.lines.insert(0, "=" * 40)
-        self.lines.insert(1, "         ClearURLs Merge Log")
-        self.lines.insert(2, "=" * 40)
-        self.lines.insert(3, f"Execution Time   : {now} (CST)")
-        self.lines.insert(4, f"Upstream Modified: {upstream_ts}")
-        self.lines.insert(5, f"Custom Modified  : {custom_ts}")
-        self.lines.insert(6, "-" * 40)
-        self.lines.insert(7, "")
+        """生成日志头部信息 (整体一次性插入到开头，避免逐行 insert(0) 反复移动列表)"""
+        self.lines[:0] = [
+            "=" * 40,
+            "         ClearURLs Merge Log",
+            "=" * 40,
+            f"Execution Time   : {NOW_STR} (CST)",
+            f"Upstream Modified: {upstream_ts}",
+            f"Custom Modified  : {custom_ts}",
+            "-" * 40,
+            "",
+        ]
 
     def save(self):
         """将日志写入文件"""
+        self.flush()
         with open(LOG_FILE, "w", encoding="utf-8") as f:
             f.write("\n".join(self.lines))
             if self.warnings:
@@ -105,9 +195,57 @@ class MergeLogger:
 
 
 def ensure_dir(directory):
-    """确保目录存在"""
-    if not os.path.exists(directory):
-        os.makedirs(directory)
+    """确保目录存在 (exist_ok 省去额外的 stat，也没有竞态)"""
+    os.makedirs(directory, exist_ok=True)
+
+
+def _new_provider():
+    """默认的 Provider 结构模板 (直接构造字面量，比 deepcopy 模板快得多)"""
+    return {
+        "urlPattern": "",
+        "completeProvider": True,
+        "rules": [],
+        "referralMarketing": [],
+        "rawRules": [],
+        "exceptions": [],
+        "redirections": [],
+        "forceRedirection": False,
+    }
+
+
+def resolve_field_op(field):
+    """查表获取补丁字段的 (操作模式, 目标字段)，表外的未知字段按前缀兜底"""
+    op = FIELD_OP.get(field)
+    if op is not None:
+        return op
+    # 只切一次前缀，替代逐个 startswith 判断
+    prefix = field[:4]
+    if prefix == "rst-":
+        return "scalar", field[4:]
+    if prefix == "del-":
+        return "skip", field[4:]
+    return "scalar", field
+
+
+@lru_cache(maxsize=4096)
+def _split_str(value):
+    """切分单个字符串块 (结果为不可变元组，供缓存复用)"""
+    items = []
+    # 1. 替换逗号为空格并切分 (支持 comma-separated)
+    for item in value.replace(",", " ").split():
+        # 2. 根据引号类型处理
+        if item.startswith("'") and item.endswith("'"):
+            # 单引号：Raw模式，内容保留原样 (例如正则: '^https?://')
+            items.append(item[1:-1])
+        elif item.startswith('"') and item.endswith('"'):
+            # 双引号：Unescape模式，还原 JSON 风格的反斜杠 (例如: "a\\b" -> a\b)
+            # 解决从 JSON 文件直接复制正则时的双重转义问题
+            content = item[1:-1]
+            items.append(content.replace("\\\\", "\\").replace('\\"', '"'))
+        else:
+            # 无引号：保留原样
+            items.append(item)
+    return tuple(items)
 
 
 def normalize_to_list(value):
@@ -120,30 +258,13 @@ def normalize_to_list(value):
     输出:
       ['a\b', 'c\b']
     """
-    final_items = []
-
-    # 情况 A: 字符串 (执行切分和引号清洗)
+    # 情况 A: 字符串 (执行切分和引号清洗，相同字符串直接命中缓存)
     if isinstance(value, str):
-        # 1. 替换逗号为空格并切分 (支持 comma-separated)
-        raw_items = value.replace(",", " ").split()
-
-        for item in raw_items:
-            # 2. 根据引号类型处理
-            if item.startswith("'") and item.endswith("'"):
-                # 单引号：Raw模式，内容保留原样 (例如正则: '^https?://')
-                final_items.append(item[1:-1])
-            elif item.startswith('"') and item.endswith('"'):
-                # 双引号：Unescape模式，还原 JSON 风格的反斜杠 (例如: "a\\b" -> a\b)
-                # 解决从 JSON 文件直接复制正则时的双重转义问题
-                content = item[1:-1]
-                final_items.append(content.replace("\\\\", "\\").replace('\\"', '"'))
-            else:
-                # 无引号：保留原样
-                final_items.append(item)
-        return final_items
+        return list(_split_str(value))
 
     # 情况 B: 列表 (递归处理每一项)
     if isinstance(value, list):
+        final_items = []
         for sub_item in value:
             final_items.extend(normalize_to_list(sub_item))
         return final_items
@@ -151,11 +272,50 @@ def normalize_to_list(value):
     return []
 
 
+def json_loads(content_bytes):
+    """解析 JSON 字节 (优先 orjson)"""
+    if orjson is not None:
+        return orjson.loads(content_bytes)
+    return json.loads(content_bytes)
+
+
+def json_dumps_compact(obj):
+    """序列化为无空格的紧凑 UTF-8 JSON 字节 (优先 orjson，两者输出一致)"""
+    if orjson is not None:
+        # YAML 会把 360: 这类键解析为 int，与 json.dumps 一样将非字符串键转为字符串
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
 def calculate_sha256(content_bytes):
-    """计算二进制内容的 SHA256 哈希值"""
+    """
+    计算二进制内容的 SHA256 哈希值。
+    调用方需传入实际写入/下载的原始字节 (而非重新编码的文本)，一次性交给
+    hashlib 处理；hashlib 由 OpenSSL 实现，CPU 支持时会自动使用 SHA 指令集加速。
+    """
     return hashlib.sha256(content_bytes).hexdigest()
 
 
+def download_with_sha256(url, headers=None):
+    """
+    流式下载并同步计算 SHA256，返回 (响应对象, 原始字节, Hash)。
+    每个分块只经手一次，无需等下载完成后再整体扫描一遍。
+    携带条件请求头且服务器返回 304 时，原始字节与 Hash 均为 None。
+    """
+    r = SESSION.get(url, headers=headers, timeout=REQUEST_TIMEOUT, stream=True)
+    h = hashlib.sha256()
+    buf = bytearray()
+    # stream=True 时连接在读完或关闭前不会归还连接池，状态检查也放在 with 内
+    with r:
+        r.raise_for_status()
+        if r.status_code == 304:
+            return r, None, None
+        for chunk in r.iter_content(DOWNLOAD_CHUNK_SIZE):
+            h.update(chunk)
+            buf += chunk
+    return r, buf, h.hexdigest()
+
+
 def format_http_date(date_str):
     """将 HTTP 头中的 GMT 时间转换为北京时间字符串"""
     if not date_str:
@@ -163,18 +323,30 @@ def format_http_date(date_str):
     try:
         dt = parsedate_to_datetime(date_str)
         dt_cn = dt.astimezone(CN_TZ)
-        return dt_cn.strftime("%Y-%m-%d %H:%M:%S")
+        return dt_cn.replace(tzinfo=None).isoformat(sep=" ", timespec="seconds")
     except Exception:
         return date_str
 
 
-def get_file_mtime(filepath):
-    """获取文件最后修改时间 (北京时间)"""
-    if os.path.exists(filepath):
-        ts = os.path.getmtime(filepath)
-        dt_cn = datetime.fromtimestamp(ts, CN_TZ)
-        return dt_cn.strftime("%Y-%m-%d %H:%M:%S")
-    return "N/A (File not found)"
+def load_build_cache():
+    """读取上次成功构建的缓存信息，不存在或已损坏时返回空字典"""
+    try:
+        with open(CACHE_FILE, "rb") as f:
+            return json_loads(f.read())
+    except (OSError, ValueError):
+        return {}
+
+
+def save_build_cache(cache):
+    """保存本次构建的缓存信息"""
+    with open(CACHE_FILE, "w", encoding="utf-8") as f:
+        json.dump(cache, f, indent=2)
+
+
+def format_timestamp(ts):
+    """将 Unix 时间戳 (如文件 st_mtime) 转换为北京时间字符串"""
+    dt_cn = datetime.fromtimestamp(ts, CN_TZ)
+    return dt_cn.replace(tzinfo=None).isoformat(sep=" ", timespec="seconds")
 
 
 # ==============================================================================
@@ -182,33 +354,103 @@ def get_file_mtime(filepath):
 # ==============================================================================
 
 
-def fetch_upstream(logger):
+def fetch_upstream(logger, cache):
     """
     获取上游规则：
-    1. 下载 JSON 和 Hash。
-    2. 校验 SHA256，不匹配则终止。
-    3. 保存一份 Pretty 格式的备份。
+    1. 若有上次构建的缓存，先只下载很小的 Hash 文件；未变化则直接读取本地备份。
+    2. 否则并发下载 JSON 和 Hash (已取得 Hash 时只下载 JSON)。
+    3. 校验 SHA256，不匹配则终止。
+    4. 保存一份 Pretty 格式的备份。
+    有缓存的 ETag/Last-Modified 时，Hash 与带条件请求头的 JSON 请求并发发出：
+    未修改时服务器返回 304 不传正文，已修改时正文与 Hash 同时到达。
+    返回 (规则数据, 上游修改时间, 上游 Hash, HTTP 校验头)。
     """
-    logger.log(f"[-] Fetching upstream from {UPSTREAM_URL}...")
     try:
-        # 下载 JSON
-        r = requests.get(UPSTREAM_URL)
-        r.raise_for_status()
-        json_bytes = r.content
-        data = r.json()
+        upstream_hash = None
+        fetched = None
+        cached_hash = cache.get("upstream_hash")
+        validators = {
+            "upstream_etag": cache.get("upstream_etag"),
+            "upstream_last_modified": cache.get("upstream_last_modified"),
+        }
+        if cached_hash:
+            cond_headers = {
+                k: v
+                for k, v in (
+                    ("If-None-Match", validators["upstream_etag"]),
+                    ("If-Modified-Since", validators["upstream_last_modified"]),
+                )
+                if v
+            }
+            logger.log(f"[-] Fetching upstream hash from {UPSTREAM_HASH_URL}...")
+            with ThreadPoolExecutor(max_workers=2) as ex:
+                f_hash = ex.submit(
+                    SESSION.get, UPSTREAM_HASH_URL, timeout=REQUEST_TIMEOUT
+                )
+                f_json = None
+                if cond_headers:
+                    logger.log(
+                        f"[-] Fetching upstream from {UPSTREAM_URL} (conditional)..."
+                    )
+                    f_json = ex.submit(download_with_sha256, UPSTREAM_URL, cond_headers)
+                r_hash = f_hash.result()
+                fetched = f_json.result() if f_json else None
+            r_hash.raise_for_status()
+            upstream_hash = r_hash.text.strip()
+
+            # 未发条件请求或返回 304 时，Hash 一致才可使用本地备份
+            if fetched is None or fetched[1] is None:
+                fetched = None
+                if upstream_hash == cached_hash:
+                    # 直接尝试打开备份，缺失时回退到完整下载 (Hash 已取得，无需重复请求)
+                    try:
+                        with open(UPSTREAM_FILE, "rb") as f:
+                            raw = f.read()
+                    except FileNotFoundError:
+                        logger.log(
+                            f"    [Cache] Backup {UPSTREAM_FILE} missing, re-downloading."
+                        )
+                    else:
+                        logger.log(
+                            f"    [Cache] Upstream unchanged, loading backup from {UPSTREAM_FILE}..."
+                        )
+                        data = json_loads(raw)
+                        return (
+                            data,
+                            cache.get("upstream_modified", "Unknown"),
+                            upstream_hash,
+                            validators,
+                        )
 
-        # 获取时间戳
+        if fetched is not None:
+            r, json_bytes, local_hash = fetched
+        elif upstream_hash is None:
+            logger.log(f"[-] Fetching upstream from {UPSTREAM_URL}...")
+            logger.log(f"[-] Fetching upstream hash from {UPSTREAM_HASH_URL}...")
+            # 两个请求互不依赖，并发下载 (耗时取两者最大值而非之和)
+            with ThreadPoolExecutor(max_workers=2) as ex:
+                f_json = ex.submit(download_with_sha256, UPSTREAM_URL)
+                f_hash = ex.submit(
+                    SESSION.get, UPSTREAM_HASH_URL, timeout=REQUEST_TIMEOUT
+                )
+                r, json_bytes, local_hash = f_json.result()
+                r_hash = f_hash.result()
+            r_hash.raise_for_status()
+            upstream_hash = r_hash.text.strip()
+        else:
+            # 304 但 Hash 已变化 (缓存不一致) 或备份缺失：不带条件头重新下载
+            logger.log(f"[-] Fetching upstream from {UPSTREAM_URL}...")
+            r, json_bytes, local_hash = download_with_sha256(UPSTREAM_URL)
+
+        # 获取时间戳与下次条件请求所需的校验头
         raw_date = r.headers.get("Last-Modified")
         formatted_date = format_http_date(raw_date)
+        validators = {
+            "upstream_etag": r.headers.get("ETag"),
+            "upstream_last_modified": raw_date,
+        }
 
-        # 下载 Hash
-        logger.log(f"[-] Fetching upstream hash from {UPSTREAM_HASH_URL}...")
-        r_hash = requests.get(UPSTREAM_HASH_URL)
-        r_hash.raise_for_status()
-        upstream_hash = r_hash.text.strip()
-
-        # 校验
-        local_hash = calculate_sha256(json_bytes)
+        # 校验 (Hash 已在下载过程中计算)
         if local_hash != upstream_hash:
             raise Exception(
                 f"Hash mismatch! Upstream: {upstream_hash}, Downloaded: {local_hash}"
@@ -216,31 +458,101 @@ def fetch_upstream(logger):
 
         logger.log("    [Check] Upstream hash verified successfully.")
 
+        # 直接解析已持有的原始字节，跳过 r.json() 的编码探测与二次解码
+        data = json_loads(json_bytes)
+
         # 保存备份
         logger.log(f"[-] Saving upstream backup to {UPSTREAM_FILE}...")
-        with open(UPSTREAM_FILE, "w", encoding="utf-8") as f:
+        with open(
+            UPSTREAM_FILE, "w", encoding="utf-8", buffering=WRITE_BUFFER_SIZE
+        ) as f:
             json.dump(data, f, indent=4, ensure_ascii=False)
 
-        return data, formatted_date
+        return data, formatted_date, upstream_hash, validators
     except Exception as e:
         logger.log(f"[!] Error fetching/verifying upstream: {e}")
         exit(1)
 
 
 def load_custom(logger):
-    """加载本地 YAML 自定义规则"""
+    """加载本地 YAML 自定义规则，返回 (规则数据, 修改时间, 文件 Hash)"""
     logger.log(f"[-] Loading custom rules from {CUSTOM_FILE}...")
-    custom_ts = get_file_mtime(CUSTOM_FILE)
-    if not os.path.exists(CUSTOM_FILE):
+    # 打开后对同一文件句柄取 mtime，避免 exists/getmtime/open 的多次 stat 与竞态
+    try:
+        with open(CUSTOM_FILE, "rb") as f:
+            custom_ts = format_timestamp(os.fstat(f.fileno()).st_mtime)
+            raw = f.read()
+    except FileNotFoundError:
         logger.warn("[!] No custom rules file found.")
-        return {}, custom_ts
-    with open(CUSTOM_FILE, "r", encoding="utf-8") as f:
-        return (yaml.safe_load(f) or {}), custom_ts
+        return {}, "N/A (File not found)", ""
+    if not yaml.__with_libyaml__:
+        logger.warn(
+            "[!] libyaml not available, using the slow pure-Python YAML loader."
+        )
+    # 直接交给 libyaml 解析原始字节，跳过 Python 层的文本解码
+    return (yaml.load(raw, Loader=SafeLoader) or {}), custom_ts, calculate_sha256(raw)
 
 
-def upsert_provider(providers, name, patch_data, section_name, logger):
+def apply_rst(target, name, field, value_list, pending_sets, logger):
+    """模式 A: 覆盖 (rst-)。以新值替换暂存集合 (去重，排序推迟到最后)"""
+    # setdefault 先占位字段，保持 merged_rules.json 中的键顺序与即时写入时一致
+    target.setdefault(field, [])
+    pending_sets[(name, field)] = set(value_list)
+
+
+def apply_del(target, name, field, value_list, pending_sets, logger):
+    """模式 B: 删除 (del-)。已暂存的字段做集合差运算，否则按原顺序过滤列表"""
+    staged = pending_sets.get((name, field))
+    # 检查全删标记
+    if len(value_list) == 1 and value_list[0] == KEYWORD_DELETE_ALL:
+        target[field] = []
+        if staged is not None:
+            staged.clear()
+        return
+
+    if staged is not None:
+        not_found_items = [x for x in value_list if x not in staged]
+        staged.difference_update(value_list)
+    else:
+        original_list = target.get(field, [])
+        # 转为集合，使两次成员判断均为 O(1)
+        original_set = set(original_list)
+        value_set = set(value_list)
+        not_found_items = [x for x in value_list if x not in original_set]
+        # 执行过滤 (保持原有顺序)
+        target[field] = [x for x in original_list if x not in value_set]
+
+    # 检查是否存在 (日志用途)
+    if not_found_items:
+        logger.warn(
+            f"        [WARN] '{name}': Cannot delete non-existent {field}: {not_found_items}"
+        )
+
+
+def apply_append(target, name, field, value_list, pending_sets, logger):
+    """模式 C: 追加 (标准数组)。合并到暂存集合中去重，排序推迟到最后"""
+    staged = pending_sets.get((name, field))
+    if staged is None:
+        staged = pending_sets[(name, field)] = set(target.setdefault(field, []))
+    # 检查重复 (日志用途)
+    duplicates = [x for x in value_list if x in staged]
+    if duplicates:
+        logger.detail(
+            f"        [Info] '{name}' ({field}): Skipped duplicates {duplicates}"
+        )
+    staged.update(value_list)
+
+
+# 数组字段的操作模式 -> 处理函数
+ARRAY_HANDLERS = {"rst": apply_rst, "del": apply_del, "append": apply_append}
+
+
+def upsert_provider(providers, name, patch_data, section_name, logger, pending_sets):
     """
     处理单个 Provider 的合并逻辑 (Add/Modify 均复用此函数)
+
+    追加/覆盖/删除的数组字段暂存于 pending_sets[(name, field)] 集合中，
+    由 process_rules 在全部补丁应用后统一排序写回，避免每次修改都重新排序。
     """
     if not patch_data:
         return
@@ -259,95 +571,62 @@ def upsert_provider(providers, name, patch_data, section_name, logger):
         if not exists:
             logger.warn(f"    [WARN] Missing Modify: '{name}' missing. Creating new.")
             action_type = "Create (Mod->Add)"
-            providers[name] = copy.deepcopy(DEFAULT_PROVIDER)
         else:
             action_type = "Modify"
 
-    # 确保 Provider 存在
-    if name not in providers:
-        providers[name] = copy.deepcopy(DEFAULT_PROVIDER)
-
-    # 只有非 WARN 状态才记录常规操作日志
-    if "WARN" not in action_type:
-        logger.log(f"    [{action_type:<6}] {name}")
+    logger.detail(f"{ACTION_PREFIX[action_type]}{name}")
 
-    target = providers[name]
+    # 取出已有 Provider，不存在时一次性创建
+    if exists:
+        target = providers[name]
+    else:
+        target = providers[name] = _new_provider()
 
     # 2. 遍历字段应用修改
     for field, value in patch_data.items():
-        value_list = []
-        is_array = False
-        target_field_name = field
-
-        # 判断是否为数组操作 (rst-, del-, 或标准字段)
-        if field.startswith("rst-"):
-            target_field_name = field[4:]
-            if target_field_name in ARRAY_FIELDS:
-                value_list = normalize_to_list(value)
-                is_array = True
-        elif field.startswith("del-"):
-            target_field_name = field[4:]
-            if target_field_name in ARRAY_FIELDS:
-                value_list = normalize_to_list(value)
-                is_array = True
-        elif field in ARRAY_FIELDS:
-            value_list = normalize_to_list(value)
-            is_array = True
-
-        # --- 执行具体逻辑 ---
-
-        # 模式 A: 覆盖 (rst-)
-        if field.startswith("rst-"):
-            if is_array:
-                # 数组覆盖：去重并排序
-                target[target_field_name] = sorted(list(set(value_list)))
-            else:
-                # 标量覆盖 (如 rst-urlPattern)
-                target[target_field_name] = value
-
-        # 模式 B: 删除 (del-)
-        elif field.startswith("del-"):
-            if is_array:
-                original_list = target.get(target_field_name, [])
-                # 检查全删标记
-                if len(value_list) == 1 and value_list[0] == KEYWORD_DELETE_ALL:
-                    target[target_field_name] = []
-                else:
-                    # 检查是否存在 (日志用途)
-                    not_found_items = [x for x in value_list if x not in original_list]
-                    if not_found_items:
-                        logger.warn(
-                            f"        [WARN] '{name}': Cannot delete non-existent {target_field_name}: {not_found_items}"
-                        )
-                    # 执行过滤
-                    target[target_field_name] = [
-                        x for x in original_list if x not in value_list
-                    ]
-
-        # 模式 C: 追加 (标准数组)
-        elif is_array:
-            original_list = target.get(field, [])
-            # 检查重复 (日志用途)
-            duplicates = [x for x in value_list if x in original_list]
-            if duplicates:
-                logger.log(
-                    f"        [Info] '{name}' ({field}): Skipped duplicates {duplicates}"
-                )
-
-            # 合并去重
-            new_set = set(original_list)
-            new_set.update(value_list)
-            target[field] = sorted(list(new_set))
-
-        # 模式 D: 标量覆盖 (标准字段)
-        else:
-            target[field] = value
+        # 一次查表得到操作模式与目标字段 (替代逐个前缀判断)
+        mode, target_field_name = resolve_field_op(field)
+
+        # 模式 D: 标量覆盖 (标准字段或 rst-urlPattern 等)
+        if mode == "scalar":
+            target[target_field_name] = value
+            continue
+        if mode == "skip":
+            continue
+
+        # 模式 A/B/C: 数组字段交给对应的处理函数
+        ARRAY_HANDLERS[mode](
+            target,
+            name,
+            target_field_name,
+            normalize_to_list(value),
+            pending_sets,
+            logger,
+        )
 
     # 3. 自动计算 completeProvider
     # 逻辑：只要有任意过滤规则，就不是 completeProvider (False)；否则为 True
     if "completeProvider" not in patch_data:
-        has_rules = any(len(target.get(f, [])) > 0 for f in RULE_FIELDS)
-        target["completeProvider"] = not has_rules
+        # 空列表/空集合即为 False，无需 len() 判断
+        target_get = target.get
+        target["completeProvider"] = not any(
+            pending_sets.get((name, f), target_get(f)) for f in RULE_FIELDS
+        )
+
+
+def commit_pending_sets(providers, pending_sets):
+    """将暂存集合排序写回 Provider (每个字段只排序一次)"""
+    for (name, field), values in pending_sets.items():
+        providers[name][field] = sorted(values)
+
+
+def apply_patches(providers, jobs, logger):
+    """按顺序应用补丁任务 [(section, name, patch), ...]"""
+    # 数组字段的暂存集合: {(provider, field): set}
+    pending_sets = {}
+    for section, name, patch in jobs:
+        upsert_provider(providers, name, patch, section, logger, pending_sets)
+    commit_pending_sets(providers, pending_sets)
 
 
 def process_rules(upstream_data, custom_data, logger):
@@ -359,26 +638,50 @@ def process_rules(upstream_data, custom_data, logger):
     del_list = normalize_to_list(custom_data.get("del-providers", []))
     for name in del_list:
         if name in providers:
-            logger.log(f"    [Delete] {name}")
+            logger.detail(f"    [Delete] {name}")
             del providers[name]
         else:
             logger.warn(
                 f"    [WARN] Delete failed: Provider '{name}' not found in upstream."
             )
 
-    # 2. 处理新增列表 (Add)
+    # 2. 按顺序处理新增列表 (Add) 与修改列表 (Modify)
     add_dict = custom_data.get("add-providers", {}) or {}
-    for name, patch in add_dict.items():
-        upsert_provider(providers, name, patch, "add-providers", logger)
-
-    # 3. 处理修改列表 (Modify)
     mod_dict = custom_data.get("modify-providers", {}) or {}
-    for name, patch in mod_dict.items():
-        upsert_provider(providers, name, patch, "modify-providers", logger)
+    jobs = [("add-providers", name, patch) for name, patch in add_dict.items()]
+    jobs += [("modify-providers", name, patch) for name, patch in mod_dict.items()]
+
+    apply_patches(providers, jobs, logger)
+
+    logger.flush()
 
     return {"providers": providers}
 
 
+def _minify_provider(provider):
+    """生成单个 Provider 的 Minified 版本 (剔除默认值与空数组)"""
+    get = provider.get
+    mini = {}
+    # 必填项
+    if "urlPattern" in provider:
+        mini["urlPattern"] = provider["urlPattern"]
+
+    # 仅保留 True
+    if get("completeProvider") is True:
+        mini["completeProvider"] = True
+
+    # 仅保留 True
+    if get("forceRedirection") is True:
+        mini["forceRedirection"] = True
+
+    # 仅保留非空数组
+    for key in MINIFY_ARRAY_KEYS:
+        if val := get(key):
+            mini[key] = val
+
+    return mini
+
+
 def minify_data(data):
     """
     生成 Minified 版本：
@@ -386,42 +689,20 @@ def minify_data(data):
     2. 剔除空数组。
     3. 特殊逻辑：completeProvider 仅当 True 时保留 (插件默认视为 False?)
     """
-    minified_providers = {}
-
-    for name, provider in data.get("providers", {}).items():
-        mini = {}
-        # 必填项
-        if "urlPattern" in provider:
-            mini["urlPattern"] = provider["urlPattern"]
-
-        # 仅保留 True
-        if provider.get("completeProvider") is True:
-            mini["completeProvider"] = True
-
-        # 仅保留 True
-        if provider.get("forceRedirection") is True:
-            mini["forceRedirection"] = True
-
-        # 仅保留非空数组
-        for key in ARRAY_FIELDS:
-            val = provider.get(key)
-            if val and len(val) > 0:
-                mini[key] = val
-
-        minified_providers[name] = mini
-
-    return {"providers": minified_providers}
+    return {
+        "providers": {
+            name: _minify_provider(provider)
+            for name, provider in data.get("providers", {}).items()
+        }
+    }
 
 
 def generate_badge(logger):
     """生成 Shields.io Endpoint 专用的 JSON"""
-    # 获取当前北京时间 YYYY-MM-DD HH:MM:SS
-    now_date = datetime.now(CN_TZ).strftime("%Y-%m-%d %H:%M:%S")
-
     badge_data = {
         "schemaVersion": 1,
         "label": "Rules Updated",  # 徽章左边的文字
-        "message": now_date,  # 徽章右边的文字 (日期)
+        "message": NOW_STR,  # 徽章右边的文字 (北京时间 YYYY-MM-DD HH:MM:SS)
         "color": "brightgreen",  # 颜色
         "cacheSeconds": 3600,  # 缓存时间
     }
@@ -434,26 +715,27 @@ def generate_badge(logger):
 def save_output(data, logger):
     """保存所有输出文件"""
     # 1. 保存 merged_rules.json (Pretty)
-    logger.log(f"[-] Saving merged rules to {OUTPUT_FILE}...")
-    with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=4, ensure_ascii=False)
+    if WRITE_PRETTY:
+        logger.log(f"[-] Saving merged rules to {OUTPUT_FILE}...")
+        with open(OUTPUT_FILE, "w", encoding="utf-8", buffering=WRITE_BUFFER_SIZE) as f:
+            json.dump(data, f, indent=4, ensure_ascii=False)
+    else:
+        logger.log(f"[-] Skipping merged rules ({OUTPUT_FILE}), WRITE_PRETTY=0.")
 
     # 2. 生成并保存 rules.minify.json (Minified)
     logger.log("[-] Generating minified rules...")
     minified_data = minify_data(data)
 
+    payload = json_dumps_compact(minified_data)
+
     logger.log(f"[-] Saving minified rules to {MINIFIED_FILE}...")
-    with open(MINIFIED_FILE, "w", encoding="utf-8") as f:
-        # separators移除所有空格
-        json.dump(
-            minified_data, f, indent=None, separators=(",", ":"), ensure_ascii=False
-        )
+    with open(MINIFIED_FILE, "wb") as f:
+        f.write(payload)
 
     # 3. 计算并保存 rules.minify.hash (SHA256)
+    # 直接对写入的字节计算，无需从磁盘读回
     logger.log(f"[-] Calculating hash for {MINIFIED_FILE}...")
-    with open(MINIFIED_FILE, "rb") as f:
-        content_bytes = f.read()
-        file_hash = calculate_sha256(content_bytes)
+    file_hash = calculate_sha256(payload)
 
     logger.log(f"[-] Saving hash ({file_hash}) to {MINIFIED_HASH_FILE}...")
     with open(MINIFIED_HASH_FILE, "w", encoding="utf-8") as f:
@@ -471,11 +753,29 @@ if __name__ == "__main__":
     ensure_dir(OUTPUT_DIR)
 
     # 初始化
-    logger = MergeLogger()
+    logger = MergeLogger(quiet=QUIET)
 
     # 获取数据
-    upstream, upstream_ts = fetch_upstream(logger)
-    custom, custom_ts = load_custom(logger)
+    cache = load_build_cache()
+    upstream, upstream_ts, upstream_hash, validators = fetch_upstream(logger, cache)
+    custom, custom_ts, custom_hash = load_custom(logger)
+
+    # 上游规则、自定义规则与构建脚本均未变化且产物齐全时，跳过本次构建
+    with open(__file__, "rb") as f:
+        builder_hash = calculate_sha256(f.read())
+    build_key = {
+        "upstream_hash": upstream_hash,
+        "custom_hash": custom_hash,
+        "builder_hash": builder_hash,
+    }
+    if all(cache.get(k) == v for k, v in build_key.items()) and all(
+        os.path.exists(p) for p in BUILD_ARTIFACTS
+    ):
+        # 内容未变但 ETag/Last-Modified 已更新时也要保存，否则之后每次都会重新下载
+        if any(cache.get(k) != v for k, v in validators.items()):
+            save_build_cache({**cache, **validators})
+        print("[skip] Upstream and custom rules unchanged, nothing to rebuild.")
+        exit(0)
 
     # 写入日志头
     logger.header(upstream_ts, custom_ts)
@@ -488,4 +788,5 @@ if __name__ == "__main__":
 
     # 结束
     logger.save()
+    save_build_cache({**build_key, "upstream_modified": upstream_ts, **validators})
     print(f"[ok] Log saved to {LOG_FILE}")